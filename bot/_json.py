@@ -0,0 +1,35 @@
+"""JSON encode/decode backed by orjson when it is installed, with a stdlib fallback."""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def dumps(obj: Any, *, indent: bool = False) -> bytes:
+    """Serialize to compact UTF-8 JSON (non-ASCII kept as-is); ``indent`` uses two spaces."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    """Like :func:`dumps` but returns ``str``, for JSON embedded in form fields."""
+    return dumps(obj).decode("utf-8")
+
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    """Parse JSON; malformed input raises ``ValueError`` with either backend."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import re
+import time
+from collections import deque
+from threading import Condition, Lock
+from typing import Deque, Dict, Mapping, Optional
+
+
+class AdmissionController:
+    """AIMD concurrency limit for an upstream API.
+
+    The limit grows additively while the average latency of recent calls stays within
+    ``l_target`` and is cut multiplicatively when the upstream signals overload (429, 5xx,
+    timeouts), the same feedback loop TCP uses for its congestion window.
+    """
+
+    def __init__(
+        self,
+        c_min: int = 1,
+        c_max: int = 32,
+        l_target: float = 5.0,
+        alpha: float = 0.5,
+        beta: float = 0.5,
+        window: int = 20,
+        initial: Optional[float] = None,
+    ) -> None:
+        self.c_min = max(1, c_min)
+        self.c_max = max(self.c_min, c_max)
+        self.l_target = l_target
+        self.alpha = alpha
+        self.beta = beta
+        self._limit = float(self.c_max if initial is None else min(max(initial, self.c_min), self.c_max))
+        self._inflight = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._cond = Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._inflight >= int(self._limit):
+                self._cond.wait()
+            self._inflight += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._inflight -= 1
+            self._cond.notify_all()
+
+    def record_latency(self, latency: float) -> None:
+        with self._cond:
+            self._latencies.append(latency)
+            average = sum(self._latencies) / len(self._latencies)
+            if average <= self.l_target:
+                self._limit = min(self.c_max, self._limit + self.alpha)
+                self._cond.notify_all()
+
+    def record_overload(self) -> None:
+        with self._cond:
+            self._limit = max(self.c_min, self._limit * self.beta)
+            self._latencies.clear()
+
+
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as ``"20ms"``, ``"1s"`` or ``"6m0s"`` into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimitTracker:
+    """Tracks the request/token buckets advertised in ``x-ratelimit-*`` response headers."""
+
+    BUCKETS = ("requests", "tokens")
+    # Only pause when a bucket is nearly empty, not merely below the threshold share.
+    MIN_REMAINING = 2
+
+    def __init__(self, max_wait: float = 30.0) -> None:
+        self.max_wait = max_wait
+        self._lock = Lock()
+        self.limits: Dict[str, Optional[int]] = dict.fromkeys(self.BUCKETS)
+        self.remaining: Dict[str, Optional[int]] = dict.fromkeys(self.BUCKETS)
+        self.reset_at: Dict[str, Optional[float]] = dict.fromkeys(self.BUCKETS)
+
+    @property
+    def requests_remaining(self) -> Optional[int]:
+        return self.remaining["requests"]
+
+    @property
+    def tokens_remaining(self) -> Optional[int]:
+        return self.remaining["tokens"]
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for bucket in self.BUCKETS:
+                limit = _parse_int(headers.get(f"x-ratelimit-limit-{bucket}"))
+                remaining = _parse_int(headers.get(f"x-ratelimit-remaining-{bucket}"))
+                reset = _parse_reset(headers.get(f"x-ratelimit-reset-{bucket}"))
+                if limit is not None:
+                    self.limits[bucket] = limit
+                if remaining is not None:
+                    self.remaining[bucket] = remaining
+                if reset is not None:
+                    self.reset_at[bucket] = now + reset
+
+    def throttle_delay(self, threshold: float = 0.1) -> float:
+        """Seconds to wait before the next call, or 0 when the buckets have headroom."""
+        now = time.monotonic()
+        delay = 0.0
+        with self._lock:
+            for bucket in self.BUCKETS:
+                limit = self.limits[bucket]
+                remaining = self.remaining[bucket]
+                reset_at = self.reset_at[bucket]
+                if not limit or remaining is None or reset_at is None or reset_at <= now:
+                    continue
+                if remaining < threshold * limit and remaining <= self.MIN_REMAINING:
+                    delay = max(delay, reset_at - now)
+        return min(delay, self.max_wait)
+
+    def wait_if_throttled(self, threshold: float = 0.1) -> float:
+        delay = self.throttle_delay(threshold)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
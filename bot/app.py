@@ -1,26 +1,40 @@
 from __future__ import annotations
 
 import base64
-import imghdr
+import functools
+import heapq
 import logging
+import random
 import re
+import secrets
+import tempfile
+import threading
 import time
 import unicodedata
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from datetime import date, datetime, timedelta
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Callable, ClassVar, Deque, Dict, List, Optional, Sequence, Tuple
 
 from requests import HTTPError, RequestException
 
+from .admission import AdmissionController
+from .cache import SingleFlight, TTLCache
 from .config import Settings, get_settings
+from .dispatcher import ChatDispatcher
+from .http_session import build_session
 from .observability import MetricsRecorder
-from .openai_client import OpenAIClient
+from .openai_client import OpenAIClient, overload_retry_after
 from .services import CurrencyService
 from .state_store import BaseStateStore, create_state_store
 from .telegram_client import TelegramClient
+from .webhook import WebhookServer
 
 logger = logging.getLogger(__name__)
 
+# (chat_id, message_id, state) -> whether the chat state changed.
+ChatHandler = Callable[[int, int, "ChatState"], bool]
+
 
 SYSTEM_PROMPT = (
     "Voce e um atendente virtual brasileiro, cordial e organizado, que responde sempre em portugues do Brasil. "
@@ -53,6 +67,14 @@ ABOUT_TEXT = (
     "para evoluir com novas funcoes."
 )
 
+WELCOME_TEXT = (
+    "Ola! Eu sou seu assistente virtual integrado com a OpenAI, especializado em tirar duvidas e trazer cotacoes em tempo real. "
+    "Posso explicar conceitos, trazer ideias para seus projetos e informar o valor atual de moedas como dolar, euro e mais. "
+    "Use o menu para ver atalhos rapidos ou simplesmente me envie uma mensagem."
+)
+
+MENU_PROMPT = "Selecione um atalho ou envie sua mensagem. O bot tambem pode verificar cotacoes em tempo real:"
+
 MENU_KEYBOARD = [
     ["Conversar com IA"],
     ["Verificar cotacoes"],
@@ -61,26 +83,149 @@ MENU_KEYBOARD = [
 
 DEFAULT_CURRENCY_CODES = ["USD", "EUR", "GBP"]
 
+SNAPSHOT_CACHE_TTL = 30.0
+SNAPSHOT_CACHE_SIZE = 64
+# Past PTAX bulletins are final, so historical snapshots can be kept much longer.
+HISTORICAL_CACHE_TTL = 24 * 60 * 60.0
+HISTORICAL_CACHE_SIZE = 256
+
+# Chats outside ALLOWED_CHAT_IDS are told about the restriction at most once per this period.
+REJECTED_NOTICE_TTL = 60 * 60.0
+REJECTED_NOTICE_SIZE = 1024
+
+STATE_PERSIST_INTERVAL = 0.25
+
+# Voice notes up to this size are spooled in memory; longer recordings spill to a temp file.
+AUDIO_SPOOL_MAX_BYTES = 1024 * 1024
+
+# getUpdates returns at most this many updates; a full batch means more are waiting.
+POLL_BATCH_LIMIT = 100
+POLL_RETRY_JITTER = 0.5
+# Wait after a failed poll; doubles on each consecutive failure and resets on success.
+POLL_FAIL_BACKOFF_MIN = 1.0
+POLL_FAIL_BACKOFF_MAX = 60.0
+# Identical polling errors are logged (with traceback) at most once per this many seconds.
+POLL_ERROR_LOG_INTERVAL = 60.0
+
+# Replies averaging more than this many seconds stop the OpenAI concurrency limit from growing.
+OPENAI_LATENCY_TARGET = 5.0
+
+_IMAGE_MAGICS = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+_CURRENCY_KEYWORDS = {
+    "dolar": "USD",
+    "usd": "USD",
+    "euro": "EUR",
+    "eur": "EUR",
+    "libra": "GBP",
+    "gbp": "GBP",
+    "iene": "JPY",
+    "jpy": "JPY",
+    "peso": "ARS",
+    "ars": "ARS",
+    "bitcoin": "BTC",
+    "btc": "BTC",
+}
+# Generic quote requests without a specific currency default to these codes.
+_CURRENCY_INTENT_KEYWORDS = ("cotacao", "cambio")
+_CURRENCY_INTENT_CODES = ("USD", "EUR")
+# Single pass over the text; the lookahead reports keywords at every offset, matching the
+# substring semantics of the previous per-keyword `in` checks.
+_CURRENCY_RE = re.compile(
+    "(?=("
+    + "|".join(
+        re.escape(keyword)
+        for keyword in sorted((*_CURRENCY_KEYWORDS, *_CURRENCY_INTENT_KEYWORDS), key=len, reverse=True)
+    )
+    + "))"
+)
+
+# Accented Latin letters common in PT-BR (and Spanish) mapped straight to lowercase ASCII.
+_ACCENT_TABLE = str.maketrans(
+    {
+        char: unicodedata.normalize("NFD", char).encode("ascii", "ignore").decode("ascii").lower()
+        for char in "áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ"
+    }
+)
+
+_RELATIVE_DAYS = {"anteontem": 2, "ontem": 1}
+_MONTH_NAMES = {
+    "janeiro": 1,
+    "fevereiro": 2,
+    "marco": 3,
+    "abril": 4,
+    "maio": 5,
+    "junho": 6,
+    "julho": 7,
+    "agosto": 8,
+    "setembro": 9,
+    "outubro": 10,
+    "novembro": 11,
+    "dezembro": 12,
+}
+_RELATIVE_DATE_RE = re.compile(r"\b(anteontem|ontem)\b")
+_DATE_DMY_RE = re.compile(r"\b(\d{1,2})[\/\.-](\d{1,2})[\/\.-](\d{2,4})\b")
+_DATE_YMD_RE = re.compile(r"\b(\d{4})[\/\.-](\d{1,2})[\/\.-](\d{1,2})\b")
+_DATE_PT_RE = re.compile(
+    r"\b(\d{1,2})\s+de\s+(janeiro|fevereiro|marco|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro)\s+de\s+(\d{4})"
+)
 
-@dataclass
+
+def _monotonic_to_wall(value: Optional[float]) -> Optional[float]:
+    if value is None:
+        return None
+    return time.time() - (time.monotonic() - value)
+
+
+def _wall_to_monotonic(value: Optional[float]) -> Optional[float]:
+    if value is None:
+        return None
+    return time.monotonic() - (time.time() - value)
+
+
+# slots: thousands of resident chats each skip a per-instance __dict__.
+@dataclass(slots=True)
 class ChatState:
-    messages: List[Dict[str, Any]] = field(default_factory=list)
+    system_message: Dict[str, Any] = field(default_factory=dict)
+    history: Deque[Dict[str, Any]] = field(default_factory=deque)
     pending_parts: List[Dict[str, Any]] = field(default_factory=list)
     last_message_id: Optional[int] = None
+    # time.monotonic() value: immune to NTP/DST jumps. Converted to wall-clock only on (de)serialization.
     last_update_ts: Optional[float] = None
     waiting_reply: bool = False
+    dirty: bool = False
+    # Bumped whenever an update for the chat arrives; lets an in-flight reply notice it is stale.
+    generation: int = 0
 
-    MAX_HISTORY: int = 10
+    MAX_HISTORY: ClassVar[int] = 10
+    IMAGE_BUDGET_BYTES: ClassVar[int] = 4 * 1024 * 1024
 
     def __post_init__(self) -> None:
         self.reset()
+        self.dirty = False
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        """Full conversation (system prompt + bounded history) in OpenAI format."""
+        return [self.system_message, *self.history]
 
     def reset(self) -> None:
-        self.messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        self.system_message = {"role": "system", "content": SYSTEM_PROMPT}
+        # maxlen evicts the oldest turn on append, replacing the old list re-slicing in _trim.
+        self.history = deque(maxlen=self.MAX_HISTORY)
         self.pending_parts.clear()
         self.last_message_id = None
         self.last_update_ts = None
         self.waiting_reply = False
+        self.dirty = True
 
     def queue_text(self, content: str) -> None:
         text = content.strip()
@@ -88,24 +233,43 @@ class ChatState:
             return
         self._queue_part({"type": "text", "text": text})
 
-    def queue_image(self, image_b64: str, caption: Optional[str] = None, mime_type: str = "image/jpeg") -> None:
+    def queue_image_ref(self, file_id: str, caption: Optional[str] = None, mime_type: Optional[str] = None) -> None:
+        """Queue an image by Telegram file_id; the bytes are only fetched when the buffer flushes."""
         if caption:
             self.queue_text(caption)
-        data_url = f"data:{mime_type};base64,{image_b64}"
-        self._queue_part({"type": "image_url", "image_url": {"url": data_url}})
+        self._queue_part({"type": "image_ref", "file_id": file_id, "mime": mime_type})
 
     def _queue_part(self, part: Dict[str, Any]) -> None:
         self.pending_parts.append(part)
-        self.last_update_ts = time.time()
+        self.last_update_ts = time.monotonic()
         self.waiting_reply = True
+        self.dirty = True
 
     def add_assistant(self, content: str) -> None:
-        self.messages.append({"role": "assistant", "content": content})
-        self._trim()
+        self.history.append({"role": "assistant", "content": content})
+        self.dirty = True
 
     def consume_pending(self) -> Optional[Dict[str, Any]]:
         if not self.pending_parts:
             return None
+
+        content: Any
+        if all(part.get("type") == "text" for part in self.pending_parts):
+            # Common case: text only, so join straight into a plain string message.
+            content = "\n".join(part["text"] for part in self.pending_parts)
+        else:
+            content = self._merge_parts()
+
+        self.pending_parts.clear()
+        self.waiting_reply = False
+        self.dirty = True
+
+        message = {"role": "user", "content": content}
+        self.history.append(message)
+        return message
+
+    def _merge_parts(self) -> List[Dict[str, Any]]:
+        """Merge runs of consecutive text parts so images keep their position in the message."""
         merged_parts: List[Dict[str, Any]] = []
         text_buffer: List[str] = []
 
@@ -120,53 +284,74 @@ class ChatState:
 
         if text_buffer:
             merged_parts.append({"type": "text", "text": "\n".join(text_buffer)})
+        return merged_parts
 
-        self.pending_parts.clear()
-        self.waiting_reply = False
+    def enforce_image_budget(self) -> None:
+        """Replace the oldest images in history with a placeholder once they exceed the budget.
 
-        if len(merged_parts) == 1 and merged_parts[0]["type"] == "text":
-            content: Any = merged_parts[0]["text"]
-        else:
-            content = merged_parts
+        Text turns are kept intact so the conversation stays coherent; the latest message is
+        never touched because it is the one about to be answered.
+        """
+        total = sum(self._image_bytes(message) for message in self.history)
+        if total <= self.IMAGE_BUDGET_BYTES:
+            return
+        for message in list(self.history)[:-1]:
+            content = message.get("content")
+            if not isinstance(content, list):
+                continue
+            for index, part in enumerate(content):
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    total -= len(part["image_url"].get("url", ""))
+                    content[index] = {"type": "text", "text": "[imagem anterior descartada]"}
+                    self.dirty = True
+            if total <= self.IMAGE_BUDGET_BYTES:
+                return
 
-        message = {"role": "user", "content": content}
-        self.messages.append(message)
-        self._trim()
-        return message
+    @staticmethod
+    def _image_bytes(message: Dict[str, Any]) -> int:
+        content = message.get("content")
+        if not isinstance(content, list):
+            return 0
+        return sum(
+            len(part["image_url"].get("url", ""))
+            for part in content
+            if isinstance(part, dict) and part.get("type") == "image_url"
+        )
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "messages": self.messages,
             "pending_parts": self.pending_parts,
             "last_message_id": self.last_message_id,
-            "last_update_ts": self.last_update_ts,
+            "last_update_ts": _monotonic_to_wall(self.last_update_ts),
             "waiting_reply": self.waiting_reply,
         }
 
     @classmethod
     def from_dict(cls, payload: Dict[str, Any]) -> "ChatState":
         instance = cls()
-        instance.messages = payload.get("messages") or [{"role": "system", "content": SYSTEM_PROMPT}]
+        messages = payload.get("messages") or []
+        if messages:
+            instance.system_message = messages[0]
+            instance.history.extend(messages[1:])
         instance.pending_parts = payload.get("pending_parts", [])
         instance.last_message_id = payload.get("last_message_id")
-        instance.last_update_ts = payload.get("last_update_ts")
+        instance.last_update_ts = _wall_to_monotonic(payload.get("last_update_ts"))
         instance.waiting_reply = payload.get("waiting_reply", False)
-        instance._trim()
+        instance.dirty = False
         return instance
 
-    def should_flush(self, buffer_seconds: float) -> bool:
+    def should_flush(self, buffer_seconds: float, now: Optional[float] = None) -> bool:
         if not self.waiting_reply or not self.pending_parts:
             return False
         if self.last_update_ts is None:
             return False
-        return time.time() - self.last_update_ts >= buffer_seconds
+        return self.last_update_ts + buffer_seconds <= (time.monotonic() if now is None else now)
 
-    def _trim(self) -> None:
-        system_message = self.messages[0]
-        history = self.messages[1:]
-        if len(history) > self.MAX_HISTORY:
-            history = history[-self.MAX_HISTORY :]
-        self.messages = [system_message] + history
+    def flush_deadline(self, buffer_seconds: float) -> Optional[float]:
+        if self.last_update_ts is None:
+            return None
+        return self.last_update_ts + buffer_seconds
 
 
 class BotApp:
@@ -174,10 +359,14 @@ class BotApp:
         self.settings = settings or get_settings()
         self.metrics = MetricsRecorder(self.settings.metrics_file_path)
         self.state_store: BaseStateStore = create_state_store(self.settings.chat_state_dir)
-        self.currency = CurrencyService(request_timeout=self.settings.request_timeout)
+        # One pooled keep-alive session for Telegram and the currency APIs; the OpenAI SDK
+        # keeps its own pooled httpx client.
+        self.http_session = build_session()
+        self.currency = CurrencyService(request_timeout=self.settings.request_timeout, session=self.http_session)
         self.telegram = TelegramClient(
             token=self.settings.telegram_bot_token,
             request_timeout=self.settings.request_timeout,
+            session=self.http_session,
         )
         self.openai = OpenAIClient(
             api_key=self.settings.openai_api_key,
@@ -186,13 +375,103 @@ class BotApp:
             metrics=self.metrics,
         )
         self.response_buffer_seconds = self.settings.response_buffer_seconds
-        self.chat_states: Dict[int, ChatState] = {}
+        # Most recently active chats last; least recently active ones are evicted past capacity.
+        self.chat_states: "OrderedDict[int, ChatState]" = OrderedDict()
+        self._states_lock = threading.Lock()
+        self.dispatcher = ChatDispatcher(
+            max_workers=self.settings.max_workers,
+            on_error=self._on_chat_task_error,
+        )
+        self._openai_gate = AdmissionController(
+            c_min=1,
+            c_max=self.settings.max_concurrent_openai,
+            l_target=OPENAI_LATENCY_TARGET,
+        )
+        self._flush_lock = threading.Lock()
+        self._flush_scheduled: set[int] = set()
+        self._flush_cond = threading.Condition()
+        self._flush_heap: List[Tuple[float, int]] = []
+        self._stop_event = threading.Event()
+        self._fail_backoff = POLL_FAIL_BACKOFF_MIN
+        self._poll_errors_logged: TTLCache[bool] = TTLCache(64, POLL_ERROR_LOG_INTERVAL)
+        self._snapshot_cache: TTLCache[str] = TTLCache(SNAPSHOT_CACHE_SIZE, SNAPSHOT_CACHE_TTL)
+        self._historical_cache: TTLCache[str] = TTLCache(HISTORICAL_CACHE_SIZE, HISTORICAL_CACHE_TTL)
+        self._rejected_notices: TTLCache[bool] = TTLCache(REJECTED_NOTICE_SIZE, REJECTED_NOTICE_TTL)
+        self._snapshot_flights: SingleFlight[Optional[str]] = SingleFlight()
+        self._download_flights: SingleFlight[str] = SingleFlight()
+        # Static replies are encoded once; sending them only formats the chat and reply ids.
+        self._static_replies: Dict[str, bytes] = {
+            "help": self.telegram.prepare_message(HELP_TEXT),
+            "about": self.telegram.prepare_message(ABOUT_TEXT),
+            "welcome": self.telegram.prepare_message(f"{WELCOME_TEXT}\n\n{MENU_PROMPT}", keyboard=MENU_KEYBOARD),
+            "menu": self.telegram.prepare_message(MENU_PROMPT, keyboard=MENU_KEYBOARD),
+        }
+        self._commands: Dict[str, ChatHandler] = {
+            "/start": self._cmd_start,
+            "/help": self._cmd_help,
+            "/menu": self._cmd_menu,
+            "/cotacoes": self._cmd_quotes,
+            "/reset": self._cmd_reset,
+            "/sobre": self._cmd_about,
+        }
+        # Keys match the lowercased MENU_KEYBOARD labels.
+        self._shortcuts: Dict[str, ChatHandler] = {
+            "ajuda": self._cmd_help,
+            "resetar conversa": self._shortcut_reset,
+            "conversar com ia": self._shortcut_chat,
+            "verificar cotacoes": self._cmd_quotes,
+        }
+        self._persist_lock = threading.Lock()
+        self._dirty_chats: set[int] = set()
         self._hydrate_states()
 
     def run(self) -> None:
         logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
         logger.info("Bot iniciado. Aguardando mensagens...")
+
+        flusher = threading.Thread(target=self._flush_loop, name="buffer-flusher", daemon=True)
+        flusher.start()
+        writer = threading.Thread(target=self._persist_loop, name="state-writer", daemon=True)
+        writer.start()
+        self.currency.warmup(DEFAULT_CURRENCY_CODES)
+
+        if self.settings.webhook_url:
+            self._run_webhook(self.settings.webhook_url)
+        else:
+            self._run_polling()
+
+        self._stop_event.set()
+        with self._flush_cond:
+            self._flush_cond.notify_all()
+        flusher.join()
+        writer.join()
+        self._submit_dirty_states()
+        self.dispatcher.shutdown()
+        self.metrics.flush()
+
+    def _run_webhook(self, url: str) -> None:
+        """Receive updates pushed by Telegram instead of polling for them."""
+        secret = self.settings.webhook_secret
+        if not secret:
+            # The endpoint is public: never accept unauthenticated updates.
+            secret = secrets.token_urlsafe(32)
+            logger.info("WEBHOOK_SECRET nao definido; usando token aleatorio para esta execucao.")
+        self.telegram.set_webhook(url, secret_token=secret)
+        server = WebhookServer(
+            self._dispatch_update,
+            path=WebhookServer.path_from_url(url),
+            secret=secret,
+            port=self.settings.webhook_port,
+        )
+        logger.info("Webhook registrado em %s (porta %s).", url, self.settings.webhook_port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Interrupcao solicitada pelo usuario. Encerrando...")
+
+    def _run_polling(self) -> None:
         offset: int | None = None
+        timeout = self.settings.polling_timeout
 
         try:
             self.telegram.delete_webhook()
@@ -202,34 +481,125 @@ class BotApp:
 
         while True:
             try:
-                self._flush_buffers_if_needed()
-                timeout = self._select_timeout()
                 try:
                     updates = self.telegram.get_updates(offset=offset, timeout=timeout)
                 except HTTPError as exc:
                     if exc.response is not None and exc.response.status_code == 409:
-                        logger.warning("Conflito 409 detectado. Tentando remover webhook e repetindo polling.")
+                        if self._first_poll_error(("409",)):
+                            logger.warning("Conflito 409 detectado. Tentando remover webhook e repetindo polling.")
                         self.telegram.delete_webhook()
-                        time.sleep(1)
+                        self._backoff_after_failure()
                         continue
                     raise
                 if updates.get("ok", False):
-                    for update in updates.get("result", []):
-                        offset = update["update_id"] + 1
-                        self._handle_update(update)
+                    self._fail_backoff = POLL_FAIL_BACKOFF_MIN
+                    result = updates.get("result") or []
+                    if result:
+                        # Acknowledge the whole batch up front: a failing update must not make
+                        # Telegram redeliver the ones that follow it.
+                        offset = result[-1]["update_id"] + 1
+                    for update in result:
+                        self._dispatch_update(update)
+                    timeout = self._next_poll_timeout(len(result))
                 else:
-                    time.sleep(1)
-                self._flush_buffers_if_needed()
+                    self._backoff_after_failure()
             except KeyboardInterrupt:
                 logger.info("Interrupcao solicitada pelo usuario. Encerrando...")
                 break
             except Exception as exc:
-                logger.exception("Erro no loop principal: %s", exc)
+                if self._first_poll_error((type(exc).__name__, str(exc))):
+                    logger.exception("Erro no loop principal (repeticoes omitidas por %.0fs): %s", POLL_ERROR_LOG_INTERVAL, exc)
                 self.metrics.record_error("main_loop_exception")
-                time.sleep(1.5)
+                self._backoff_after_failure()
+
+    def _first_poll_error(self, key: Tuple[str, ...]) -> bool:
+        """True the first time `key` is seen within POLL_ERROR_LOG_INTERVAL; metrics still count every hit."""
+        if self._poll_errors_logged.get(key) is not None:
+            return False
+        self._poll_errors_logged.set(key, True)
+        return True
+
+    def _next_poll_timeout(self, batch_size: int) -> int:
+        """Long-poll timeout for the next getUpdates call given the size of the last batch."""
+        if batch_size >= POLL_BATCH_LIMIT:
+            # Backlog pending: short poll so it is drained without waiting.
+            return 0
+        # Long polling returns as soon as an update arrives, so a shorter timeout would only add idle round-trips.
+        return self.settings.polling_timeout
+
+    def _backoff_after_failure(self) -> None:
+        # Jitter keeps many bot instances from reconnecting in lockstep after a Telegram outage.
+        time.sleep(self._fail_backoff + random.uniform(0, POLL_RETRY_JITTER))
+        self._fail_backoff = min(self._fail_backoff * 2, POLL_FAIL_BACKOFF_MAX)
+
+    def _flush_loop(self) -> None:
+        """Flush buffers as their deadlines expire, independently of the long-poll cycle."""
+        while not self._stop_event.is_set():
+            with self._flush_cond:
+                delay = self._flush_heap[0][0] - time.monotonic() if self._flush_heap else None
+                if delay is None or delay > 0:
+                    # Sleep until the earliest deadline, or until a new one is scheduled.
+                    self._flush_cond.wait(delay)
+                    continue
+            try:
                 self._flush_buffers_if_needed()
+            except Exception as exc:  # pragma: no cover - defensive path
+                logger.exception("Erro ao descarregar buffers: %s", exc)
+                self.metrics.record_error("flush_loop_exception")
+
+    def _persist_loop(self) -> None:
+        """Coalesce state writes: each dirty chat is saved at most once per interval."""
+        while not self._stop_event.wait(STATE_PERSIST_INTERVAL):
+            self._submit_dirty_states()
+
+    def _submit_dirty_states(self) -> None:
+        with self._persist_lock:
+            chat_ids, self._dirty_chats = self._dirty_chats, set()
+        for chat_id in chat_ids:
+            # Saving on the chat's own worker keeps serialization consistent with its updates.
+            self.dispatcher.submit(chat_id, self._persist_if_dirty, chat_id)
+
+    def _schedule_persist(self, chat_id: int) -> None:
+        with self._persist_lock:
+            self._dirty_chats.add(chat_id)
+
+    def _persist_if_dirty(self, chat_id: int) -> None:
+        state = self.chat_states.get(chat_id)
+        if state and state.dirty:
+            self._persist_state(chat_id, state)
+
+    def _dispatch_update(self, update: Dict[str, Any]) -> None:
+        try:
+            message = update.get("message") or update.get("edited_message")
+            chat = message.get("chat") if isinstance(message, dict) else None
+            if not isinstance(chat, dict) or "id" not in chat:
+                return
+            chat_id = int(chat["id"])
+        except (AttributeError, TypeError, ValueError) as exc:
+            logger.warning("Update invalido ignorado (%s): %s", update.get("update_id"), exc)
+            self.metrics.record_error("invalid_update")
+            return
+        allowed = self.settings.allowed_chat_ids
+        if allowed is not None and chat_id not in allowed:
+            # Rejected before any ChatState is created, so unknown chats cost no memory.
+            self.metrics.record_error("chat_not_allowed")
+            if self._rejected_notices.get(chat_id) is None:
+                self._rejected_notices.set(chat_id, True)
+                self.dispatcher.submit(chat_id, self._send_access_denied, chat_id)
+            return
+        with self._states_lock:
+            state = self.chat_states.get(chat_id)
+            if state is not None:
+                state.generation += 1
+        self.dispatcher.submit(chat_id, self._handle_update, update)
+
+    def _send_access_denied(self, chat_id: int) -> None:
+        self.telegram.send_message(chat_id, "Acesso restrito: este bot nao esta liberado para este chat.")
 
-    def _handle_update(self, update: Dict[str, object]) -> None:
+    def _on_chat_task_error(self, chat_id: int, exc: Exception) -> None:
+        self.metrics.record_error("chat_task_exception")
+
+    def _handle_update(self, update: Dict[str, Any]) -> None:
         message = update.get("message") or update.get("edited_message")
         if not isinstance(message, dict):
             return
@@ -247,101 +617,142 @@ class BotApp:
         state.last_message_id = message_id
 
         text = (message.get("text") or "").strip()
-        caption = (message.get("caption") or "").strip()
-
-        command_text = text or caption
+        command_text = text or (message.get("caption") or "").strip()
         if command_text.startswith("/"):
             if self._handle_command(chat_id, message_id, command_text, state):
-                self._persist_state(chat_id, state)
+                self._schedule_persist(chat_id)
             return
 
         if text and self._handle_shortcut(chat_id, message_id, text, state):
-            self._persist_state(chat_id, state)
+            self._schedule_persist(chat_id)
             return
 
-        state_mutated = False
-        media_handled = False
-        voice_handled = self._process_voice_message(chat_id, message, state)
-        media_handled = voice_handled or media_handled
-        state_mutated = state_mutated or voice_handled
-        image_handled = self._process_image_message(chat_id, message, state)
-        media_handled = image_handled or media_handled
-        state_mutated = state_mutated or image_handled
+        # A Telegram message carries at most one media kind, so at most one handler runs.
+        if "voice" in message or "audio" in message:
+            media_handled = self._process_voice_message(chat_id, message, state)
+        elif "photo" in message or "document" in message:
+            media_handled = self._process_image_message(chat_id, message, state)
+        else:
+            media_handled = False
 
+        state_mutated = media_handled
         if text and not media_handled:
             state.queue_text(text)
             state_mutated = True
 
         if state_mutated:
-            self._persist_state(chat_id, state)
+            self._schedule_persist(chat_id)
+            self._schedule_flush(chat_id, state)
 
     def _handle_command(self, chat_id: int, message_id: int, text: str, state: ChatState) -> bool:
-        command = text.split()[0].lower()
-        if command == "/start":
-            self._send_welcome(chat_id, message_id)
-            return False
-        if command == "/help":
-            self.telegram.send_message(chat_id, HELP_TEXT, reply_to=message_id)
+        handler = self._commands.get(text.split()[0].lower())
+        if handler is None:
+            self.telegram.send_message(chat_id, "Comando nao reconhecido. Use /help para ver as opcoes.", reply_to=message_id)
             return False
-        if command == "/menu":
-            self._send_menu(chat_id)
-            return False
-        if command == "/cotacoes":
-            self._send_currency_snapshot(chat_id, DEFAULT_CURRENCY_CODES, reply_to=message_id)
-            return False
-        if command == "/reset":
-            state.reset()
-            self.telegram.send_message(chat_id, "Historico apagado. Podemos recomecar!", reply_to=message_id)
-            return True
-        if command == "/sobre":
-            self.telegram.send_message(chat_id, ABOUT_TEXT, reply_to=message_id)
+        return handler(chat_id, message_id, state)
+
+    def _handle_shortcut(self, chat_id: int, message_id: int, text: str, state: ChatState) -> bool:
+        handler = self._shortcuts.get(text.lower())
+        if handler is None:
             return False
+        handler(chat_id, message_id, state)
+        return True
 
-        self.telegram.send_message(chat_id, "Comando nao reconhecido. Use /help para ver as opcoes.", reply_to=message_id)
+    # Command handlers return True when they changed the chat state.
+    def _cmd_start(self, chat_id: int, message_id: int, state: ChatState) -> bool:
+        self._send_welcome(chat_id, message_id)
         return False
 
-    def _handle_shortcut(self, chat_id: int, message_id: int, text: str, state: ChatState) -> bool:
-        normalized = text.lower()
-        if normalized == "ajuda":
-            self.telegram.send_message(chat_id, HELP_TEXT, reply_to=message_id)
-            return True
-        if normalized == "resetar conversa":
-            state.reset()
-            self.telegram.send_message(chat_id, "Historico apagado. Pode mandar sua proxima pergunta!", reply_to=message_id)
-            return True
-        if normalized == "conversar com ia":
-            self.telegram.send_message(chat_id, "Ok, me conte como posso ajudar hoje.", reply_to=message_id)
-            return True
-        if normalized == "verificar cotacoes":
-            self._send_currency_snapshot(chat_id, DEFAULT_CURRENCY_CODES, reply_to=message_id)
-            return True
+    def _cmd_help(self, chat_id: int, message_id: int, state: ChatState) -> bool:
+        self.telegram.send_prepared(chat_id, self._static_replies["help"], reply_to=message_id)
+        return False
+
+    def _cmd_menu(self, chat_id: int, message_id: int, state: ChatState) -> bool:
+        self._send_menu(chat_id)
+        return False
+
+    def _cmd_quotes(self, chat_id: int, message_id: int, state: ChatState) -> bool:
+        self._send_currency_snapshot(chat_id, DEFAULT_CURRENCY_CODES, reply_to=message_id)
+        return False
+
+    def _cmd_reset(self, chat_id: int, message_id: int, state: ChatState) -> bool:
+        state.reset()
+        self.telegram.send_message(chat_id, "Historico apagado. Podemos recomecar!", reply_to=message_id)
+        return True
+
+    def _cmd_about(self, chat_id: int, message_id: int, state: ChatState) -> bool:
+        self.telegram.send_prepared(chat_id, self._static_replies["about"], reply_to=message_id)
         return False
 
+    def _shortcut_reset(self, chat_id: int, message_id: int, state: ChatState) -> bool:
+        state.reset()
+        self.telegram.send_message(chat_id, "Historico apagado. Pode mandar sua proxima pergunta!", reply_to=message_id)
+        return True
+
+    def _shortcut_chat(self, chat_id: int, message_id: int, state: ChatState) -> bool:
+        self.telegram.send_message(chat_id, "Ok, me conte como posso ajudar hoje.", reply_to=message_id)
+        return False
+
+    def _schedule_flush(self, chat_id: int, state: ChatState) -> None:
+        deadline = state.flush_deadline(self.response_buffer_seconds)
+        if deadline is None:
+            return
+        with self._flush_cond:
+            heapq.heappush(self._flush_heap, (deadline, chat_id))
+            if self._flush_heap[0][1] == chat_id:
+                self._flush_cond.notify()
+
     def _flush_buffers_if_needed(self) -> None:
-        for chat_id, state in list(self.chat_states.items()):
-            if state.should_flush(self.response_buffer_seconds):
-                self._reply_with_buffer(chat_id, state)
-
-    def _select_timeout(self) -> int:
-        if any(state.waiting_reply for state in self.chat_states.values()):
-            short_timeout = max(1, int(self.response_buffer_seconds))
-            return min(self.settings.polling_timeout, short_timeout)
-        return self.settings.polling_timeout
+        now = time.monotonic()
+        due: List[int] = []
+        with self._flush_cond:
+            while self._flush_heap and self._flush_heap[0][0] <= now:
+                due.append(heapq.heappop(self._flush_heap)[1])
+
+        for chat_id in due:
+            state = self.chat_states.get(chat_id)
+            # Entries superseded by a newer part are stale; the newer deadline is still queued.
+            if state is None or not state.should_flush(self.response_buffer_seconds, now):
+                continue
+            with self._flush_lock:
+                if chat_id in self._flush_scheduled:
+                    continue
+                self._flush_scheduled.add(chat_id)
+            self.dispatcher.submit(chat_id, self._flush_chat, chat_id)
+
+    def _flush_chat(self, chat_id: int) -> None:
+        with self._flush_lock:
+            self._flush_scheduled.discard(chat_id)
+        state = self.chat_states.get(chat_id)
+        # Re-check inside the chat's worker: new parts may have arrived since scheduling.
+        if state and state.should_flush(self.response_buffer_seconds):
+            self._reply_with_buffer(chat_id, state)
 
     def _hydrate_states(self) -> None:
+        capacity = self.settings.max_active_chats
         for chat_id in self.state_store.list_chat_ids():
+            if len(self.chat_states) >= capacity:
+                # The rest load on demand when those chats write again.
+                break
             payload = self.state_store.load(chat_id)
             if not payload:
                 continue
             try:
-                self.chat_states[chat_id] = ChatState.from_dict(payload)
+                state = ChatState.from_dict(payload)
             except Exception as exc:  # pragma: no cover - defensive path
                 logger.warning("Falha ao carregar estado do chat %s: %s", chat_id, exc)
+                continue
+            with self._states_lock:
+                self.chat_states[chat_id] = state
+            if state.waiting_reply:
+                self._schedule_flush(chat_id, state)
 
     def _get_chat_state(self, chat_id: int) -> ChatState:
-        state = self.chat_states.get(chat_id)
-        if state:
-            return state
+        with self._states_lock:
+            state = self.chat_states.get(chat_id)
+            if state:
+                self.chat_states.move_to_end(chat_id)
+                return state
         payload = self.state_store.load(chat_id)
         if payload:
             try:
@@ -351,17 +762,44 @@ class BotApp:
                 state = ChatState()
         else:
             state = ChatState()
-        self.chat_states[chat_id] = state
+        with self._states_lock:
+            state = self.chat_states.setdefault(chat_id, state)
+            self.chat_states.move_to_end(chat_id)
+            self._evict_inactive_states(keep=chat_id)
         return state
 
+    def _evict_inactive_states(self, keep: int) -> None:
+        """Drop least recently active chats beyond capacity; caller holds `_states_lock`.
+
+        Chats with a pending buffer, unsaved changes or queued work are skipped so nothing is
+        lost; an evicted chat is transparently reloaded from the state store on its next message.
+        Without a persistent store nothing is evicted, since that would discard the history.
+        """
+        if not self.state_store.persistent:
+            return
+        excess = len(self.chat_states) - self.settings.max_active_chats
+        if excess <= 0:
+            return
+        victims: List[int] = []
+        for chat_id, state in self.chat_states.items():
+            if len(victims) >= excess:
+                break
+            if chat_id == keep or state.waiting_reply or state.dirty or self.dispatcher.is_busy(chat_id):
+                continue
+            victims.append(chat_id)
+        for chat_id in victims:
+            del self.chat_states[chat_id]
+
     def _persist_state(self, chat_id: int, state: ChatState) -> None:
+        state.dirty = False
         try:
             self.state_store.save(chat_id, state.to_dict())
         except Exception as exc:  # pragma: no cover - defensive path
             logger.warning("Nao foi possivel persistir estado do chat %s: %s", chat_id, exc)
 
     def _delete_state(self, chat_id: int) -> None:
-        self.chat_states.pop(chat_id, None)
+        with self._states_lock:
+            self.chat_states.pop(chat_id, None)
         try:
             self.state_store.delete(chat_id)
         except Exception as exc:  # pragma: no cover - defensive path
@@ -372,7 +810,8 @@ class BotApp:
         if not message:
             return
 
-        self._persist_state(chat_id, state)
+        self._materialize_images(chat_id, message, state)
+        self._schedule_persist(chat_id)
 
         context = self._build_realtime_context(message)
         if context:
@@ -380,8 +819,9 @@ class BotApp:
 
         self.telegram.send_chat_action(chat_id, "typing")
 
+        generation = state.generation
         try:
-            reply = self.openai.generate_reply(state.messages)
+            reply = self._call_openai(self.openai.generate_reply, state.messages, sample_latency=True)
         except Exception as exc:
             logger.exception("Falha ao chamar a OpenAI: %s", exc)
             self.metrics.record_error("openai_call")
@@ -392,10 +832,55 @@ class BotApp:
             self.telegram.send_message(chat_id, fallback, reply_to=state.last_message_id)
             return
 
+        if state.generation != generation:
+            # The user kept writing while the model answered. Those updates are queued behind this
+            # task, so decide what to do with the reply once they have been handled.
+            self.dispatcher.submit(chat_id, self._deliver_late_reply, chat_id, state, message, reply)
+            return
+        self._deliver_reply(chat_id, state, reply)
+
+    def _deliver_reply(self, chat_id: int, state: ChatState, reply: str) -> None:
         state.add_assistant(reply)
         self._persist_state(chat_id, state)
         self.telegram.send_message(chat_id, reply, reply_to=state.last_message_id, parse_mode=None)
 
+    def _deliver_late_reply(self, chat_id: int, state: ChatState, message: Dict[str, Any], reply: str) -> None:
+        if state.pending_parts:
+            # New content is buffered: the next flush answers it together with `message`.
+            logger.info("Resposta descartada por novas mensagens no chat %s", chat_id)
+            return
+        if not state.history or state.history[-1] is not message:
+            # History was reset (or moved on) in the meantime.
+            return
+        self._deliver_reply(chat_id, state, reply)
+
+    def _call_openai(self, func: Any, *args: Any, sample_latency: bool = False) -> Any:
+        # Throttle before taking a slot so the pause neither blocks other workers nor counts as latency.
+        self.openai.rate_limits.wait_if_throttled()
+        self._openai_gate.acquire()
+        start = time.monotonic()
+        try:
+            result = func(*args)
+        except Exception as exc:
+            retry_after = overload_retry_after(exc)
+            if retry_after is not None:
+                self._openai_gate.record_overload()
+                logger.warning(
+                    "OpenAI sobrecarregada; limite de concorrencia reduzido para %s (%s chamadas em andamento)",
+                    self._openai_gate.limit,
+                    self._openai_gate.inflight,
+                )
+                # Hold the slot for the advised period so other workers do not retry immediately.
+                if retry_after:
+                    time.sleep(retry_after)
+            raise
+        else:
+            if sample_latency:
+                self._openai_gate.record_latency(time.monotonic() - start)
+            return result
+        finally:
+            self._openai_gate.release()
+
     def _process_voice_message(self, chat_id: int, message: Dict[str, Any], state: ChatState) -> bool:
         voice_payload = message.get("voice") or message.get("audio")
         if not isinstance(voice_payload, dict):
@@ -408,8 +893,9 @@ class BotApp:
         mime_type = voice_payload.get("mime_type") or "audio/ogg"
         caption = (message.get("caption") or "").strip()
         try:
-            audio_bytes = self._download_file_bytes(file_id)
-            transcription = self.openai.transcribe_audio(audio_bytes, mime_type)
+            with tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_MAX_BYTES) as audio_file:
+                self.telegram.download_file_to(self._resolve_file_path(file_id), audio_file)
+                transcription = self._call_openai(self.openai.transcribe_audio, audio_file, mime_type)
         except Exception as exc:
             logger.exception("Erro ao processar audio: %s", exc)
             self.metrics.record_error("audio_processing")
@@ -454,9 +940,22 @@ class BotApp:
         if not file_id:
             return False
 
+        prompt = caption or "Analise a imagem enviada e comente os pontos principais."
+        state.queue_image_ref(file_id, prompt, file_info.get("mime_type"))
+        return True
+
+    def _materialize_images(self, chat_id: int, message: Dict[str, Any], state: ChatState) -> None:
+        content = message.get("content")
+        if not isinstance(content, list):
+            return
+        for index, part in enumerate(content):
+            if isinstance(part, dict) and part.get("type") == "image_ref":
+                content[index] = self._load_image_part(chat_id, part, state)
+        state.enforce_image_budget()
+
+    def _load_image_part(self, chat_id: int, part: Dict[str, Any], state: ChatState) -> Dict[str, Any]:
         try:
-            image_bytes = self._download_file_bytes(file_id)
-            image_b64 = base64.b64encode(image_bytes).decode("ascii")
+            image_b64 = self._download_file_b64(part["file_id"])
         except Exception as exc:
             logger.exception("Erro ao baixar imagem: %s", exc)
             self.metrics.record_error("image_processing")
@@ -465,14 +964,19 @@ class BotApp:
                 "Nao consegui abrir a imagem que voce enviou. Pode tentar novamente?",
                 reply_to=state.last_message_id,
             )
-            return True
+            return {"type": "text", "text": "[Imagem enviada pelo usuario nao pode ser carregada]"}
 
-        prompt = caption or "Analise a imagem enviada e comente os pontos principais."
-        mime_type = self._guess_image_mime(file_info.get("mime_type"), image_bytes)
-        state.queue_image(image_b64, prompt, mime_type)
-        return True
+        # The first 16 base64 characters decode to the 12 header bytes used for detection.
+        mime_type = self._guess_image_mime(part.get("mime"), base64.b64decode(image_b64[:16]))
+        return {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_b64}"}}
+
+    def _download_file_b64(self, file_id: str) -> str:
+        return self._download_flights.do(
+            file_id,
+            lambda: self.telegram.download_file_b64(self._resolve_file_path(file_id)),
+        )
 
-    def _download_file_bytes(self, file_id: str) -> bytes:
+    def _resolve_file_path(self, file_id: str) -> str:
         file_data = self.telegram.get_file(file_id)
         if not file_data.get("ok"):
             raise RuntimeError("Telegram retornou erro ao buscar o arquivo.")
@@ -481,41 +985,26 @@ class BotApp:
         file_path = result.get("file_path")
         if not file_path:
             raise RuntimeError("Telegram nao retornou file_path.")
-
-        return self.telegram.download_file(file_path)
+        return file_path
 
     @staticmethod
     def _guess_image_mime(declared_mime: Optional[str], data: bytes, fallback: str = "image/jpeg") -> str:
         if declared_mime:
             return declared_mime
-        detected = imghdr.what(None, data)
-        mapping = {
-            "jpeg": "image/jpeg",
-            "png": "image/png",
-            "gif": "image/gif",
-            "bmp": "image/bmp",
-            "tiff": "image/tiff",
-            "webp": "image/webp",
-        }
-        if detected:
-            return mapping.get(detected, fallback)
+        head = data[:12]
+        for magic, mime_type in _IMAGE_MAGICS:
+            if head.startswith(magic):
+                return mime_type
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return "image/webp"
         return fallback
 
     def _send_welcome(self, chat_id: int, message_id: int) -> None:
-        welcome_text = (
-            "Ola! Eu sou seu assistente virtual integrado com a OpenAI, especializado em tirar duvidas e trazer cotacoes em tempo real. "
-            "Posso explicar conceitos, trazer ideias para seus projetos e informar o valor atual de moedas como dolar, euro e mais. "
-            "Use o menu para ver atalhos rapidos ou simplesmente me envie uma mensagem."
-        )
-        self.telegram.send_message(chat_id, welcome_text, reply_to=message_id)
-        self._send_menu(chat_id)
+        # One sendMessage carrying the keyboard instead of a separate menu message.
+        self.telegram.send_prepared(chat_id, self._static_replies["welcome"], reply_to=message_id)
 
     def _send_menu(self, chat_id: int) -> None:
-        self.telegram.send_message(
-            chat_id,
-            "Selecione um atalho ou envie sua mensagem. O bot tambem pode verificar cotacoes em tempo real:",
-            keyboard=MENU_KEYBOARD,
-        )
+        self.telegram.send_prepared(chat_id, self._static_replies["menu"])
 
     def _send_currency_snapshot(
         self,
@@ -524,7 +1013,7 @@ class BotApp:
         reply_to: Optional[int] = None,
     ) -> None:
         try:
-            context = self.currency.fetch_currency_snapshot(codes)
+            context = self._cached_snapshot(codes)
         except (RequestException, ValueError) as exc:
             logger.warning("Falha ao buscar cotacoes para menu: %s", exc)
             self.metrics.record_error("currency_lookup")
@@ -559,17 +1048,30 @@ class BotApp:
         self.telegram.send_message(chat_id, message, reply_to=reply_to)
 
     def _build_realtime_context(self, message: Dict[str, Any]) -> Optional[str]:
-        content = message.get("content")
-        text_fragments = self._extract_text_fragments(content)
-        if not text_fragments:
+        currency_codes, reference_date = self._classify(message)
+        if not currency_codes:
             return None
+        return self._context_for(list(currency_codes), reference_date)
+
+    def _classify(self, message: Dict[str, Any]) -> Tuple[Tuple[str, ...], Optional[date]]:
+        text_fragments = self._extract_text_fragments(message.get("content"))
+        if not text_fragments:
+            return (), None
+        return self._classify_text(" ".join(text_fragments), datetime.now().date())
 
-        normalized = self._normalize_text(" ".join(text_fragments))
-        currency_codes = self._detect_currency_codes(normalized)
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _classify_text(text: str, today: date) -> Tuple[Tuple[str, ...], Optional[date]]:
+        # Keyed on today's date too, so relative dates ("ontem") roll over at midnight.
+        normalized = BotApp._normalize_text(text)
+        currency_codes = tuple(BotApp._detect_currency_codes(normalized))
         if not currency_codes:
-            return None
+            return (), None
+        return currency_codes, BotApp._detect_reference_date(normalized, today)
 
-        reference_date = self._detect_reference_date(normalized)
+    def _context_for(self, currency_codes: List[str], reference_date: Optional[date]) -> Optional[str]:
+        # Upstream results are memoized by the snapshot caches (live TTL / long-lived PTAX);
+        # failure messages below are intentionally never cached.
         if reference_date:
             today = datetime.now().date()
             reference_display = reference_date.strftime("%d/%m/%Y")
@@ -582,7 +1084,7 @@ class BotApp:
                 )
 
             try:
-                historical_context = self.currency.fetch_historical_snapshot(currency_codes, reference_date)
+                historical_context = self._cached_historical_snapshot(currency_codes, reference_date)
             except (RequestException, ValueError) as exc:  # pragma: no cover - external service may fail
                 logger.warning("Falha ao buscar cotacoes historicas: %s", exc)
                 self.metrics.record_error("currency_context_ptax")
@@ -603,7 +1105,7 @@ class BotApp:
             )
 
         try:
-            data_context = self.currency.fetch_currency_snapshot(currency_codes)
+            data_context = self._cached_snapshot(currency_codes)
         except (RequestException, ValueError) as exc:  # pragma: no cover - external service may fail
             logger.warning("Falha ao buscar cotacoes: %s", exc)
             self.metrics.record_error("currency_context")
@@ -615,6 +1117,43 @@ class BotApp:
 
         return data_context
 
+    def _cached_snapshot(self, codes: Sequence[str]) -> Optional[str]:
+        key = tuple(codes)
+        cached = self._snapshot_cache.get(key)
+        if cached is not None:
+            return cached
+
+        def fetch() -> Optional[str]:
+            # Another flight may have filled the cache while we waited to become leader.
+            refreshed = self._snapshot_cache.get(key)
+            if refreshed is not None:
+                return refreshed
+            snapshot = self.currency.fetch_currency_snapshot(codes)
+            if snapshot:
+                self._snapshot_cache.set(key, snapshot)
+            return snapshot
+
+        return self._snapshot_flights.do(("live", key), fetch)
+
+    def _cached_historical_snapshot(self, codes: Sequence[str], reference_date: date) -> Optional[str]:
+        key = (tuple(codes), reference_date)
+        cached = self._historical_cache.get(key)
+        if cached is not None:
+            return cached
+
+        def fetch() -> Optional[str]:
+            refreshed = self._historical_cache.get(key)
+            if refreshed is not None:
+                return refreshed
+            snapshot = self.currency.fetch_historical_snapshot(codes, reference_date)
+            if snapshot:
+                # Today's PTAX may still receive intraday bulletins; only past dates are final.
+                ttl = HISTORICAL_CACHE_TTL if reference_date < datetime.now().date() else SNAPSHOT_CACHE_TTL
+                self._historical_cache.set(key, snapshot, ttl=ttl)
+            return snapshot
+
+        return self._snapshot_flights.do(("historical", key), fetch)
+
     @staticmethod
     def _append_context_to_message(message: Dict[str, Any], context: str) -> None:
         if not context:
@@ -637,30 +1176,29 @@ class BotApp:
             stripped = content.strip()
             return [stripped] if stripped else []
 
-        fragments: List[str] = []
-        if isinstance(content, list):
-            for part in content:
-                if not isinstance(part, dict):
-                    continue
-                if part.get("type") == "text":
-                    text_value = str(part.get("text", "")).strip()
-                    if text_value:
-                        fragments.append(text_value)
-        return fragments
+        if not isinstance(content, list):
+            return []
+        return [
+            text_value
+            for part in content
+            if isinstance(part, dict)
+            and part.get("type") == "text"
+            and (text_value := str(part.get("text", "")).strip())
+        ]
 
     @staticmethod
     def _normalize_text(text: str) -> str:
-        normalized = unicodedata.normalize("NFD", text)
-        ascii_text = normalized.encode("ascii", "ignore").decode("ascii")
-        return ascii_text.lower()
+        normalized = text.translate(_ACCENT_TABLE).lower()
+        if normalized.isascii():
+            return normalized
+        # Rare characters outside the table (emoji, symbols, other scripts) keep the full NFD path.
+        return unicodedata.normalize("NFD", normalized).encode("ascii", "ignore").decode("ascii")
 
     @staticmethod
-    def _detect_reference_date(normalized_text: str) -> Optional[date]:
-        relative_keywords = (("anteontem", 2), ("ontem", 1))
-        today = datetime.now().date()
-        for keyword, days in relative_keywords:
-            if keyword in normalized_text:
-                return today - timedelta(days=days)
+    def _detect_reference_date(normalized_text: str, today: Optional[date] = None) -> Optional[date]:
+        match = _RELATIVE_DATE_RE.search(normalized_text)
+        if match:
+            return (today or datetime.now().date()) - timedelta(days=_RELATIVE_DAYS[match.group(1)])
 
         def normalize_year(token: str) -> int:
             value = int(token)
@@ -675,13 +1213,13 @@ class BotApp:
             except ValueError:
                 return None
 
-        match = re.search(r"\b(\d{1,2})[\/\.-](\d{1,2})[\/\.-](\d{2,4})\b", normalized_text)
+        match = _DATE_DMY_RE.search(normalized_text)
         if match:
             candidate = build_date(match.group(1), match.group(2), match.group(3))
             if candidate:
                 return candidate
 
-        match = re.search(r"\b(\d{4})[\/\.-](\d{1,2})[\/\.-](\d{1,2})\b", normalized_text)
+        match = _DATE_YMD_RE.search(normalized_text)
         if match:
             try:
                 candidate = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
@@ -690,27 +1228,10 @@ class BotApp:
             if candidate:
                 return candidate
 
-        month_names = {
-            "janeiro": 1,
-            "fevereiro": 2,
-            "marco": 3,
-            "abril": 4,
-            "maio": 5,
-            "junho": 6,
-            "julho": 7,
-            "agosto": 8,
-            "setembro": 9,
-            "outubro": 10,
-            "novembro": 11,
-            "dezembro": 12,
-        }
-        match = re.search(
-            r"\b(\d{1,2})\s+de\s+(janeiro|fevereiro|marco|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro)\s+de\s+(\d{4})",
-            normalized_text,
-        )
+        match = _DATE_PT_RE.search(normalized_text)
         if match:
             day_token, month_name, year_token = match.groups()
-            month_value = month_names.get(month_name)
+            month_value = _MONTH_NAMES.get(month_name)
             if month_value:
                 try:
                     candidate = date(int(year_token), month_value, int(day_token))
@@ -723,28 +1244,13 @@ class BotApp:
 
     @staticmethod
     def _detect_currency_codes(normalized_text: str) -> List[str]:
-        keywords = {
-            "dolar": "USD",
-            "usd": "USD",
-            "euro": "EUR",
-            "eur": "EUR",
-            "libra": "GBP",
-            "gbp": "GBP",
-            "iene": "JPY",
-            "jpy": "JPY",
-            "peso": "ARS",
-            "ars": "ARS",
-            "bitcoin": "BTC",
-            "btc": "BTC",
-        }
-
         detected: set[str] = set()
-        for keyword, code in keywords.items():
-            if keyword in normalized_text:
+        for match in _CURRENCY_RE.finditer(normalized_text):
+            code = _CURRENCY_KEYWORDS.get(match.group(1))
+            if code:
                 detected.add(code)
-
-        if "cotacao" in normalized_text or "cambio" in normalized_text:
-            detected.update({"USD", "EUR"})
+            else:
+                detected.update(_CURRENCY_INTENT_CODES)
 
         return sorted(detected)
 
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Callable, Dict, FrozenSet, Generic, Hashable, Iterable, List, Optional, Set, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Small thread-safe LRU cache whose entries expire after a time-to-live."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class SingleFlight(Generic[V]):
+    """Collapses concurrent calls for the same key into a single execution."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._inflight: Dict[Hashable, "Future[V]"] = {}
+
+    def do(self, key: Hashable, func: Callable[[], V]) -> V:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class _Batch:
+    __slots__ = ("keys", "future")
+
+    def __init__(self, keys: FrozenSet[Hashable]) -> None:
+        self.keys: Set[Hashable] = set(keys)
+        self.future: "Future[Any]" = Future()
+
+
+class KeyBatcher(Generic[V]):
+    """Merges keys requested concurrently into a single ``fetch`` call.
+
+    With no fetch in flight a caller fetches its own keys right away. Callers whose keys are
+    covered by an in-flight fetch share its result; the others join a batch that waits
+    ``window`` seconds, then fetches the union of every key requested meanwhile. If a batched
+    fetch fails, each caller retries with just its own keys, so one bad key does not fail
+    everyone else.
+    """
+
+    def __init__(self, fetch: Callable[[FrozenSet[Hashable]], V], window: float = 0.25) -> None:
+        self.fetch = fetch
+        self.window = window
+        self._lock = Lock()
+        self._inflight: List[_Batch] = []
+        self._pending: Optional[_Batch] = None
+
+    def get(self, keys: Iterable[Hashable]) -> V:
+        wanted = frozenset(keys)
+        leader = windowed = False
+        with self._lock:
+            batch = next((batch for batch in self._inflight if wanted <= batch.keys), None)
+            if batch is None:
+                if not self._inflight:
+                    batch = _Batch(wanted)
+                    self._inflight.append(batch)
+                    leader = True
+                elif self._pending is None:
+                    batch = self._pending = _Batch(wanted)
+                    leader = windowed = True
+                else:
+                    batch = self._pending
+                    batch.keys.update(wanted)
+        if not leader:
+            return self._follow(batch, wanted)
+
+        if windowed:
+            time.sleep(self.window)
+            with self._lock:
+                # Close the window: later callers start a new batch.
+                self._pending = None
+                self._inflight.append(batch)
+        batch_keys = frozenset(batch.keys)
+        try:
+            result = self.fetch(batch_keys)
+        except BaseException as exc:
+            self._finish(batch)
+            batch.future.set_exception(exc)
+            if wanted == batch_keys or not isinstance(exc, Exception):
+                raise
+            return self.fetch(wanted)
+        self._finish(batch)
+        batch.future.set_result(result)
+        return result
+
+    def _follow(self, batch: _Batch, wanted: FrozenSet[Hashable]) -> V:
+        try:
+            return batch.future.result()
+        except Exception:
+            if wanted == batch.keys:
+                raise
+            return self.fetch(wanted)
+
+    def _finish(self, batch: _Batch) -> None:
+        with self._lock:
+            self._inflight.remove(batch)
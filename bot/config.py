@@ -1,25 +1,60 @@
 from __future__ import annotations
 
 import os
+import re
 from dataclasses import dataclass
-from typing import Optional
+from typing import FrozenSet, Optional
 
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+# Characters and length Telegram accepts for setWebhook's secret_token.
+_WEBHOOK_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
 
 @dataclass(frozen=True)
 class Settings:
     telegram_bot_token: str
     openai_api_key: str
     openai_model: str = "gpt-4o-mini"
-    polling_timeout: int = 25
+    # Telegram's maximum long-poll timeout.
+    polling_timeout: int = 50
     request_timeout: int = 20
     response_buffer_seconds: float = 2.5
     openai_transcription_model: str = "gpt-4o-mini-transcribe"
     chat_state_dir: Optional[str] = None
     metrics_file_path: Optional[str] = None
+    max_workers: int = 8
+    max_concurrent_openai: int = 4
+    max_active_chats: int = 1000
+    webhook_url: Optional[str] = None
+    webhook_secret: Optional[str] = None
+    webhook_port: int = 8080
+    allowed_chat_ids: Optional[FrozenSet[int]] = None
+
+
+def _read_positive_int(name: str, default: int) -> int:
+    raw_value = os.getenv(name, "").strip()
+    if not raw_value:
+        return default
+    try:
+        value = int(raw_value)
+    except ValueError as exc:
+        raise RuntimeError(f"{name} deve ser um numero inteiro (ex.: {default}).") from exc
+    if value < 1:
+        raise RuntimeError(f"{name} deve ser maior que zero.")
+    return value
+
+
+def _read_chat_ids(name: str) -> Optional[FrozenSet[int]]:
+    raw_value = os.getenv(name, "").strip()
+    if not raw_value:
+        return None
+    try:
+        return frozenset(int(item) for item in raw_value.split(",") if item.strip())
+    except ValueError as exc:
+        raise RuntimeError(f"{name} deve ser uma lista de chat ids separados por virgula (ex.: 123,-456).") from exc
 
 
 def get_settings(env_path: Optional[str] = None) -> Settings:
@@ -36,6 +71,15 @@ def get_settings(env_path: Optional[str] = None) -> Settings:
     buffer_value = os.getenv("RESPONSE_BUFFER_SECONDS", "").strip()
     chat_state_dir = os.getenv("CHAT_STATE_DIR", "").strip() or None
     metrics_file_path = os.getenv("METRICS_FILE", "").strip() or None
+    max_workers = _read_positive_int("MAX_WORKERS", 8)
+    max_concurrent_openai = _read_positive_int("OPENAI_MAX_CONCURRENCY", 4)
+    max_active_chats = _read_positive_int("MAX_ACTIVE_CHATS", 1000)
+    webhook_url = os.getenv("WEBHOOK_URL", "").strip() or None
+    webhook_secret = os.getenv("WEBHOOK_SECRET", "").strip() or None
+    webhook_port = _read_positive_int("WEBHOOK_PORT", 8080)
+    if webhook_secret and not _WEBHOOK_SECRET_RE.fullmatch(webhook_secret):
+        raise RuntimeError("WEBHOOK_SECRET deve ter de 1 a 256 caracteres entre A-Z, a-z, 0-9, _ e -.")
+    allowed_chat_ids = _read_chat_ids("ALLOWED_CHAT_IDS")
 
     if buffer_value:
         try:
@@ -69,4 +113,11 @@ def get_settings(env_path: Optional[str] = None) -> Settings:
         openai_transcription_model=transcription_model,
         chat_state_dir=chat_state_dir,
         metrics_file_path=metrics_file_path,
+        max_workers=max_workers,
+        max_concurrent_openai=max_concurrent_openai,
+        max_active_chats=max_active_chats,
+        webhook_url=webhook_url,
+        webhook_secret=webhook_secret,
+        webhook_port=webhook_port,
+        allowed_chat_ids=allowed_chat_ids,
     )
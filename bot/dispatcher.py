@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ChatTask = Tuple[Callable[..., Any], Tuple[Any, ...]]
+
+
+class ChatDispatcher:
+    """Runs chat work on a thread pool, in parallel across chats and in order within a chat."""
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        on_error: Optional[Callable[[int, Exception], None]] = None,
+    ) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="chat-worker")
+        self._lock = Lock()
+        self._queues: Dict[int, Deque[ChatTask]] = {}
+        self._on_error = on_error
+        self._closed = False
+
+    def submit(self, chat_id: int, func: Callable[..., Any], *args: Any) -> None:
+        with self._lock:
+            queue = self._queues.get(chat_id)
+            if queue is not None:
+                # A worker is already draining this chat; it will pick the task up in order.
+                queue.append((func, args))
+                return
+            if self._closed:
+                # Late arrivals during shutdown (e.g. webhook handler threads) are dropped.
+                logger.debug("Dispatcher encerrado; tarefa do chat %s ignorada.", chat_id)
+                return
+            self._queues[chat_id] = deque([(func, args)])
+        self._executor.submit(self._drain, chat_id)
+
+    def is_busy(self, chat_id: int) -> bool:
+        with self._lock:
+            return chat_id in self._queues
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=wait)
+
+    def _drain(self, chat_id: int) -> None:
+        while True:
+            with self._lock:
+                queue = self._queues[chat_id]
+                if not queue:
+                    del self._queues[chat_id]
+                    return
+                func, args = queue.popleft()
+            try:
+                func(*args)
+            except Exception as exc:
+                logger.exception("Erro ao processar tarefa do chat %s: %s", chat_id, exc)
+                if self._on_error:
+                    self._on_error(chat_id, exc)
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 32
+
+
+def build_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Keep-alive session shared by the HTTP clients so TLS connections are reused."""
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=3,
+        backoff_factor=0.3,
+        # 429 is left to the callers so they can honor provider-specific retry hints.
+        status_forcelist=(500, 502, 503, 504),
+        # POSTs (sendMessage, setWebhook) are not idempotent: a 5xx or read timeout may arrive
+        # after Telegram already delivered the message. Connect errors are still retried.
+        allowed_methods=frozenset({"GET"}),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry_strategy)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {
+            "Connection": "keep-alive",
+            "User-Agent": "UniversityAIBot/1.0",
+        }
+    )
+    return session
@@ -1,18 +1,33 @@
 from __future__ import annotations
 
-import json
+import atexit
+import os
 import time
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, Optional
+from threading import Lock, Timer
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+from . import _json
+
+# Metrics are written at most this often; record_* calls only touch memory.
+FLUSH_INTERVAL = 0.5
 
 
 class MetricsRecorder:
     """Collects lightweight metrics and optionally persists them to disk."""
 
-    def __init__(self, file_path: Optional[str] = None) -> None:
+    def __init__(self, file_path: Optional[str] = None, flush_interval: float = FLUSH_INTERVAL) -> None:
         self.file_path = Path(file_path) if file_path else None
+        self.flush_interval = flush_interval
         self._lock = Lock()
+        self._write_lock = Lock()
+        self._timer_lock = Lock()
+        self._timer: Optional[Timer] = None
+        # Bumped on every change; the file is current when it matches _flushed_version.
+        self._version = 0
+        self._flushed_version = 0
+        self._chats_changed = False
         self._data: Dict[str, Any] = {
             "total_updates": 0,
             "unique_chats": [],
@@ -24,18 +39,24 @@ class MetricsRecorder:
         self._seen_chats = set[int]()
         if self.file_path and self.file_path.exists():
             self._load_from_disk()
+        if self.file_path:
+            atexit.register(self.flush)
 
     def record_update(self, chat_id: int) -> None:
         with self._lock:
             self._data["total_updates"] += 1
-            self._seen_chats.add(chat_id)
-            self._persist()
+            if chat_id not in self._seen_chats:
+                self._seen_chats.add(chat_id)
+                self._chats_changed = True
+            self._mark_dirty()
 
     def record_openai_call(
         self,
         duration: float,
         prompt_tokens: Optional[int] = None,
         completion_tokens: Optional[int] = None,
+        requests_remaining: Optional[int] = None,
+        tokens_remaining: Optional[int] = None,
     ) -> None:
         with self._lock:
             stats = self._data["openai_calls"]
@@ -45,40 +66,92 @@ class MetricsRecorder:
                 stats["total_prompt_tokens"] += prompt_tokens
             if completion_tokens is not None:
                 stats["total_completion_tokens"] += completion_tokens
-            self._persist()
+            if requests_remaining is not None:
+                stats["last_requests_remaining"] = requests_remaining
+            if tokens_remaining is not None:
+                stats["last_tokens_remaining"] = tokens_remaining
+            self._mark_dirty()
 
     def record_transcription(self, duration: float) -> None:
         with self._lock:
             stats = self._data["transcriptions"]
             stats["count"] += 1
             stats["total_duration"] += duration
-            self._persist()
+            self._mark_dirty()
 
     def record_error(self, kind: str) -> None:
         with self._lock:
             errors = self._data["errors"]
             errors[kind] = errors.get(kind, 0) + 1
-            self._persist()
+            self._mark_dirty()
 
     def snapshot(self) -> Dict[str, Any]:
         with self._lock:
-            return json.loads(json.dumps(self._data))
+            self._sync_unique_chats()
+            # Values are scalars or one level of dicts/lists of scalars, so copying
+            # the containers is enough for an independent snapshot.
+            return {
+                key: dict(value) if isinstance(value, dict) else list(value) if isinstance(value, list) else value
+                for key, value in self._data.items()
+            }
 
-    def _persist(self) -> None:
-        self._data["last_updated"] = time.time()
-        self._data["unique_chats"] = sorted(self._seen_chats)
+    def snapshot_readonly(self) -> Mapping[str, Any]:
+        """Read-only view of the live data, without copying.
+
+        Only safe when nothing records concurrently (e.g. the ``stats`` CLI); use
+        ``snapshot()`` anywhere else.
+        """
+        with self._lock:
+            self._sync_unique_chats()
+            return MappingProxyType(self._data)
+
+    def flush(self) -> None:
+        """Write pending changes to disk now (also runs from the debounce timer and at exit)."""
+        with self._timer_lock:
+            self._timer = None
         if not self.file_path:
             return
+        # One writer at a time, so an older snapshot can never land after a newer one.
+        with self._write_lock:
+            with self._lock:
+                if self._version == self._flushed_version:
+                    return
+                self._sync_unique_chats()
+                payload = _json.dumps(self._data, indent=True)
+                version = self._version
+
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+            tmp_path.write_bytes(payload)
+            os.replace(tmp_path, self.file_path)
+            # Only now is the data on disk; a failed write leaves it pending for the next flush.
+            with self._lock:
+                self._flushed_version = version
+
+    def _mark_dirty(self) -> None:
+        # Caller holds self._lock.
+        self._data["last_updated"] = time.time()
+        self._version += 1
+        if self.file_path:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        with self._timer_lock:
+            if self._timer is None:
+                self._timer = Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
 
-        self.file_path.parent.mkdir(parents=True, exist_ok=True)
-        with self.file_path.open("w", encoding="utf-8") as handler:
-            json.dump(self._data, handler, ensure_ascii=False, indent=2)
+    def _sync_unique_chats(self) -> None:
+        # Caller holds self._lock; re-sort only when a new chat was seen.
+        if self._chats_changed:
+            self._data["unique_chats"] = sorted(self._seen_chats)
+            self._chats_changed = False
 
     def _load_from_disk(self) -> None:
         try:
-            with self.file_path.open("r", encoding="utf-8") as handler:
-                payload = json.load(handler)
-        except json.JSONDecodeError:
+            payload = _json.loads(self.file_path.read_bytes())
+        except ValueError:
             return
         self._data.update(payload)
         unique = payload.get("unique_chats", [])
@@ -1,17 +1,53 @@
 from __future__ import annotations
 
-import io
+import functools
 import logging
 import mimetypes
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, BinaryIO, Dict, List, Optional, Union
 
-from openai import OpenAI
+from openai import APIStatusError, APITimeoutError, OpenAI, RateLimitError
 
+from .admission import RateLimitTracker
 from .observability import MetricsRecorder
 
 logger = logging.getLogger(__name__)
 
+MAX_RETRY_AFTER_SECONDS = 30.0
+
+# Audio MIME types Telegram sends for voice notes and audio files.
+_AUDIO_EXTENSIONS = {
+    "audio/ogg": "ogg",
+    "audio/oga": "ogg",
+    "audio/opus": "ogg",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/mp4": "m4a",
+    "audio/x-m4a": "m4a",
+    "audio/m4a": "m4a",
+    "audio/aac": "aac",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/webm": "webm",
+    "audio/flac": "flac",
+}
+
+
+def overload_retry_after(exc: BaseException) -> Optional[float]:
+    """Return how long to back off if ``exc`` signals upstream overload, else ``None``."""
+    if isinstance(exc, RateLimitError):
+        retry_after = exc.response.headers.get("retry-after") if exc.response is not None else None
+        try:
+            delay = float(retry_after) if retry_after else 1.0
+        except ValueError:
+            delay = 1.0
+        return min(max(delay, 0.0), MAX_RETRY_AFTER_SECONDS)
+    if isinstance(exc, APITimeoutError):
+        return 0.0
+    if isinstance(exc, APIStatusError) and exc.status_code >= 500:
+        return 0.0
+    return None
+
 
 class OpenAIClient:
     def __init__(
@@ -25,27 +61,36 @@ class OpenAIClient:
         self.model = model
         self.transcription_model = transcription_model
         self.metrics = metrics
+        self.rate_limits = RateLimitTracker(max_wait=MAX_RETRY_AFTER_SECONDS)
 
     def generate_reply(self, messages: List[Dict[str, Any]], temperature: float = 0.7) -> str:
         """Send the conversation to OpenAI and return the assistant reply."""
         start = time.perf_counter()
-        response = self.client.chat.completions.create(
+        raw_response = self.client.chat.completions.with_raw_response.create(
             model=self.model,
             messages=messages,
             temperature=temperature,
             max_tokens=700,
         )
         duration = time.perf_counter() - start
+        self.rate_limits.update(raw_response.headers)
+        response = raw_response.parse()
 
-        usage = getattr(response, "usage", None)
-        prompt_tokens = getattr(usage, "prompt_tokens", None) if usage else None
-        completion_tokens = getattr(usage, "completion_tokens", None) if usage else None
+        try:
+            usage = response.usage
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+        except AttributeError:
+            # `usage` is optional in the API response.
+            prompt_tokens = completion_tokens = None
 
         if self.metrics:
             self.metrics.record_openai_call(
                 duration=duration,
                 prompt_tokens=prompt_tokens,
                 completion_tokens=completion_tokens,
+                requests_remaining=self.rate_limits.requests_remaining,
+                tokens_remaining=self.rate_limits.tokens_remaining,
             )
         logger.debug(
             "OpenAI reply generated",
@@ -58,49 +103,66 @@ class OpenAIClient:
 
         return response.choices[0].message.content.strip()
 
-    def transcribe_audio(self, data: bytes, mime_type: str | None = None) -> str:
-        """Transcribe audio bytes using the configured OpenAI transcription model."""
+    def transcribe_audio(self, data: Union[bytes, BinaryIO], mime_type: str | None = None) -> str:
+        """Transcribe audio (raw bytes or a readable file) with the configured transcription model.
+
+        File objects are uploaded from their current content without being read into memory.
+        """
         guessed_extension = self._extension_from_mime(mime_type)
-        audio_buffer = io.BytesIO(data)
         filename = f"audio.{guessed_extension}"
-        audio_buffer.name = filename
-        audio_buffer.seek(0)
+        # The SDK takes raw bytes in the file tuple, so bytes go through without a BytesIO wrapper.
+        content: Union[bytes, BinaryIO]
+        if isinstance(data, (bytes, bytearray)):
+            content = bytes(data)
+        else:
+            content = data
+            content.seek(0)
 
         if mime_type:
-            file_payload = (filename, audio_buffer, mime_type)
+            file_payload = (filename, content, mime_type)
         else:
-            file_payload = (filename, audio_buffer)
+            file_payload = (filename, content)
 
         start = time.perf_counter()
-        response = self.client.audio.transcriptions.create(
+        raw_response = self.client.audio.transcriptions.with_raw_response.create(
             model=self.transcription_model,
             file=file_payload,
         )
         duration = time.perf_counter() - start
+        self.rate_limits.update(raw_response.headers)
+        response = raw_response.parse()
         if self.metrics:
             self.metrics.record_transcription(duration)
         logger.debug("OpenAI transcription completed", extra={"duration": duration})
 
         # SDK retorna objeto com atributo text; fazemos fallback para dict/str
-        text = getattr(response, "text", None)
-        if text:
-            return text.strip()
-        if isinstance(response, dict):
-            return str(response.get("text", "")).strip()
-        if isinstance(response, str):
-            return response.strip()
-        return ""
+        try:
+            text = response.text
+        except AttributeError:
+            if isinstance(response, dict):
+                text = str(response.get("text", ""))
+            elif isinstance(response, str):
+                text = response
+            else:
+                text = ""
+        return text.strip() if text else ""
 
     @staticmethod
     def _extension_from_mime(mime_type: str | None) -> str:
         if not mime_type:
             return "mp3"
+        known = _AUDIO_EXTENSIONS.get(mime_type)
+        if known:
+            return known
+        return OpenAIClient._guess_extension(mime_type)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _guess_extension(mime_type: str) -> str:
         extension = mimetypes.guess_extension(mime_type)
         if extension:
             clean = extension.lstrip(".")
             if clean in {"oga", "ogg"}:
                 return "ogg"
             return clean
-        if mime_type == "audio/ogg":
-            return "ogg"
         return "mp3"
@@ -1,31 +1,59 @@
 from __future__ import annotations
 
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
-from typing import Any, Dict, Iterable, List, Optional, Sequence
+from typing import AbstractSet, Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import requests
-from requests import RequestException
+
+from ..cache import KeyBatcher, TTLCache
+from ..http_session import build_session
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=64)
+def _quotes_url(codes: Tuple[str, ...]) -> str:
+    """AwesomeAPI URL for a sorted tuple of codes; the menu asks for the same set every time."""
+    pairs = ",".join(f"{code}-BRL" for code in codes)
+    return f"https://economia.awesomeapi.com.br/json/last/{pairs}"
 
 
 class CurrencyService:
     """Fetches currency information from AwesomeAPI and formats human-readable output."""
 
     PTAX_BASE_URL = "https://olinda.bcb.gov.br/olinda/servico/PTAX/versao/v1/odata"
+    PTAX_MAX_WORKERS = 8
+    # Bulletins for past days are final; today's may still change until the closing one is out.
+    PTAX_CACHE_SIZE = 1024
+    PTAX_PAST_TTL = 7 * 24 * 60 * 60.0
+    PTAX_TODAY_TTL = 10 * 60.0
 
-    def __init__(self, request_timeout: int = 20, ptax_max_fallback_days: int = 7) -> None:
+    def __init__(
+        self,
+        request_timeout: int = 20,
+        ptax_max_fallback_days: int = 7,
+        session: Optional[requests.Session] = None,
+        batch_window: float = 0.25,
+    ) -> None:
         self.request_timeout = request_timeout
         self.ptax_max_fallback_days = max(0, ptax_max_fallback_days)
+        self.session = session or build_session()
+        # Concurrent snapshot requests from different chats share one AwesomeAPI call.
+        self._quotes: KeyBatcher[Dict[str, Dict[str, str]]] = KeyBatcher(self._fetch_quotes, window=batch_window)
+        # PTAX has one endpoint call per currency; codes are looked up in parallel.
+        self._ptax_executor = ThreadPoolExecutor(max_workers=self.PTAX_MAX_WORKERS, thread_name_prefix="ptax")
+        # (code, date) -> (record,); the tuple lets "no bulletin that day" be cached as well.
+        self._ptax_cache: TTLCache[Tuple[Optional[Dict[str, Any]]]] = TTLCache(self.PTAX_CACHE_SIZE, self.PTAX_PAST_TTL)
 
     def fetch_currency_snapshot(self, codes: Sequence[str]) -> Optional[str]:
         if not codes:
             return None
 
-        pairs = ",".join(f"{code}-BRL" for code in codes)
-        url = f"https://economia.awesomeapi.com.br/json/last/{pairs}"
-
-        response = requests.get(url, timeout=self.request_timeout)
-        response.raise_for_status()
-        payload: Dict[str, Dict[str, str]] = response.json()
+        payload = self._quotes.get(codes)
 
         lines: List[str] = []
         timestamp_display: Optional[str] = None
@@ -65,9 +93,16 @@ class CurrencyService:
         requested_date = self._ensure_date(target_date)
         requested_display = requested_date.strftime("%d/%m/%Y")
 
+        if len(normalized_codes) == 1:
+            quotes = [self._fetch_ptax_quote(normalized_codes[0], requested_date)]
+        else:
+            # map keeps the requested order and re-raises the first failure, like the serial loop did.
+            quotes = list(
+                self._ptax_executor.map(lambda code: self._fetch_ptax_quote(code, requested_date), normalized_codes)
+            )
+
         lines: List[str] = []
-        for code in normalized_codes:
-            quote = self._fetch_ptax_quote(code, requested_date)
+        for code, quote in zip(normalized_codes, quotes):
             if not quote:
                 continue
             lines.append(self._format_ptax_line(code, quote, requested_date))
@@ -79,25 +114,29 @@ class CurrencyService:
         body = "\n".join(lines)
         return f"{header}\nDados solicitados para {requested_display}:\n{body}"
 
-    @staticmethod
-    def _safe_number(value: Optional[object]) -> str:
+    def _fetch_quotes(self, codes: AbstractSet[str]) -> Dict[str, Dict[str, str]]:
+        url = _quotes_url(tuple(sorted(codes)))
+        response = self.session.get(url, timeout=self.request_timeout, allow_redirects=False)
+        response.raise_for_status()
+        return response.json()
+
+    @classmethod
+    def _safe_number(cls, value: Optional[object]) -> str:
         if value is None:
             return "-"
-        try:
-            number = float(str(value).replace(",", "."))
-            return f"R$ {number:.4f}"
-        except (TypeError, ValueError):
+        number = cls._to_float(value)
+        if number is None:
             return str(value)
+        return f"R$ {number:.4f}"
 
-    @staticmethod
-    def _format_variation(value: Optional[str]) -> str:
+    @classmethod
+    def _format_variation(cls, value: Optional[str]) -> str:
         if value is None:
             return ""
-        try:
-            number = float(str(value).replace(",", "."))
-            return f" (variacao diaria: {number:+.2f}%)"
-        except (TypeError, ValueError):
+        number = cls._to_float(value)
+        if number is None:
             return f" (variacao diaria: {value})"
+        return f" (variacao diaria: {number:+.2f}%)"
 
     @staticmethod
     def _format_timestamp(value: object) -> str:
@@ -118,12 +157,20 @@ class CurrencyService:
         return text
 
     def warmup(self, default_codes: Iterable[str]) -> None:
-        """Optional helper that tries to warm the currency cache early."""
+        """Optional helper that warms the AwesomeAPI connection in the background.
+
+        Returns immediately so startup never waits on the network.
+        """
+        threading.Thread(
+            target=self._warmup_impl, args=(list(default_codes),), name="currency-warmup", daemon=True
+        ).start()
+
+    def _warmup_impl(self, codes: List[str]) -> None:
         try:
-            self.fetch_currency_snapshot(list(default_codes))
-        except RequestException:
-            # Ignore warmup errors to avoid impacting bot startup
-            return
+            self.fetch_currency_snapshot(codes)
+        except Exception as exc:
+            # Warmup is best effort; the first real lookup simply pays the cost instead.
+            logger.warning("Falha ao aquecer conexao de cotacoes: %s", exc)
 
     @staticmethod
     def _ensure_date(value: date | datetime) -> date:
@@ -165,6 +212,16 @@ class CurrencyService:
         return None
 
     def _query_ptax_endpoint(self, code: str, reference_date: date) -> Optional[Dict[str, Any]]:
+        key = (code, reference_date)
+        cached = self._ptax_cache.get(key)
+        if cached is not None:
+            return cached[0]
+        record = self._request_ptax_endpoint(code, reference_date)
+        ttl = self.PTAX_TODAY_TTL if reference_date >= date.today() else None
+        self._ptax_cache.set(key, (record,), ttl=ttl)
+        return record
+
+    def _request_ptax_endpoint(self, code: str, reference_date: date) -> Optional[Dict[str, Any]]:
         date_param = reference_date.strftime("%m-%d-%Y")
         if code == "USD":
             url = (
@@ -178,7 +235,7 @@ class CurrencyService:
                 "&$top=1&$orderby=dataHoraCotacao%20desc&$format=json"
             )
 
-        response = requests.get(url, timeout=self.request_timeout)
+        response = self.session.get(url, timeout=self.request_timeout, allow_redirects=False)
         response.raise_for_status()
         payload = response.json()
         values: List[Dict[str, Any]] = payload.get("value") or []
@@ -214,6 +271,13 @@ class CurrencyService:
     def _to_float(value: Any) -> Optional[float]:
         if value is None:
             return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        # AwesomeAPI and PTAX send dot-decimal strings; only retry with a comma swap if that fails.
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            pass
         try:
             return float(str(value).replace(",", "."))
         except (TypeError, ValueError):
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
-import json
+import os
 from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Any, Dict, Iterable, Optional
 
+from . import _json
+
 
 class BaseStateStore(ABC):
     """Interface for persisting chat state snapshots."""
 
+    # False when saved states cannot be loaded back (persistence disabled).
+    persistent = True
+
     @abstractmethod
     def load(self, chat_id: int) -> Optional[Dict[str, Any]]:
         raise NotImplementedError
@@ -29,6 +34,8 @@ class BaseStateStore(ABC):
 class NullStateStore(BaseStateStore):
     """No-op store used when persistence is disabled."""
 
+    persistent = False
+
     def load(self, chat_id: int) -> Optional[Dict[str, Any]]:
         return None
 
@@ -57,26 +64,32 @@ class JSONStateStore(BaseStateStore):
         if not file_path.exists():
             return None
         try:
-            with file_path.open("r", encoding="utf-8") as handler:
-                return json.load(handler)
-        except json.JSONDecodeError:
+            return _json.loads(file_path.read_bytes())
+        except ValueError:
             # Corrupted file: remove to avoid repeated failures
             file_path.unlink(missing_ok=True)
             return None
 
     def save(self, chat_id: int, payload: Dict[str, Any]) -> None:
         file_path = self._file_for(chat_id)
-        with file_path.open("w", encoding="utf-8") as handler:
-            json.dump(payload, handler, ensure_ascii=False, indent=2)
+        tmp_path = file_path.with_name(file_path.name + ".tmp")
+        tmp_path.write_bytes(_json.dumps(payload))
+        # Atomic swap: readers never see a half-written file, even if the bot dies mid-write.
+        os.replace(tmp_path, file_path)
 
     def delete(self, chat_id: int) -> None:
         self._file_for(chat_id).unlink(missing_ok=True)
 
     def list_chat_ids(self) -> Iterable[int]:
-        for file_path in self.base_path.glob("chat_*.json"):
-            name = file_path.stem.removeprefix("chat_")
-            if name.isdigit():
-                yield int(name)
+        # scandir + slicing instead of glob: no Path object per file in large state dirs.
+        with os.scandir(self.base_path) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith("chat_") and name.endswith(".json"):
+                    chat_id = name[5:-5]
+                    # Group chats have negative ids.
+                    if chat_id.removeprefix("-").isdigit():
+                        yield int(chat_id)
 
 
 def create_state_store(path: Optional[str]) -> BaseStateStore:
@@ -1,31 +1,34 @@
 from __future__ import annotations
 
-import json
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
+import base64
+import functools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-
-def _build_session() -> requests.Session:
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=0.3,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=frozenset({"GET", "POST"}),
-    )
-    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=retry_strategy)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    session.headers.update(
-        {
-            "Connection": "keep-alive",
-            "User-Agent": "UniversityAIBot/1.0",
-        }
-    )
-    return session
+
+from . import _json
+from .http_session import build_session
+
+logger = logging.getLogger(__name__)
+
+# 429 is handled by TelegramClient itself so it can honor `parameters.retry_after`.
+FLOOD_WAIT_ATTEMPTS = 3
+
+# Multiple of 3 so every full chunk encodes to base64 without padding.
+DOWNLOAD_CHUNK_SIZE = 48 * 1024
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Sent with every getUpdates/setWebhook call; serialized once.
+ALLOWED_UPDATES_JSON = _json.dumps_str(["message", "edited_message"])
+
+
+@functools.lru_cache(maxsize=32)
+def _reply_markup(keyboard: Tuple[Tuple[str, ...], ...]) -> str:
+    """JSON for a reply keyboard; the bot only uses a handful, so each is encoded once."""
+    return _json.dumps_str({"keyboard": keyboard, "resize_keyboard": True, "one_time_keyboard": False})
 
 
 @dataclass
@@ -33,27 +36,33 @@ class TelegramClient:
     token: str
     request_timeout: int = 20
     session: Optional[requests.Session] = None
+    _urls: Dict[str, str] = field(init=False, repr=False)
 
     API_URL_TEMPLATE = "https://api.telegram.org/bot{token}/{method}"
+    API_METHODS = ("getUpdates", "sendMessage", "sendChatAction", "deleteWebhook", "setWebhook", "getFile")
 
     def __post_init__(self) -> None:
         if self.session is None:
-            self.session = _build_session()
-
-    def _url(self, method: str) -> str:
-        return self.API_URL_TEMPLATE.format(token=self.token, method=method)
+            self.session = build_session()
+        # Built once: getUpdates alone is called on every long-poll iteration.
+        self._urls = {
+            method: self.API_URL_TEMPLATE.format(token=self.token, method=method) for method in self.API_METHODS
+        }
 
-    def get_updates(self, offset: Optional[int] = None, timeout: int = 25) -> Dict[str, Any]:
+    def get_updates(self, offset: Optional[int] = None, timeout: int = 30) -> Dict[str, Any]:
         payload: Dict[str, Any] = {
             "timeout": timeout,
-            "allowed_updates": json.dumps(["message", "edited_message"]),
+            "allowed_updates": ALLOWED_UPDATES_JSON,
         }
         if offset is not None:
             payload["offset"] = offset
 
-        response = self.session.get(self._url("getUpdates"), params=payload, timeout=self.request_timeout)
+        # Long polling holds the connection open for `timeout` seconds; the read timeout must outlast it.
+        http_timeout = (self.request_timeout, timeout + 5)
+        response = self.session.get(self._urls["getUpdates"], params=payload, timeout=http_timeout)
         response.raise_for_status()
-        return response.json()
+        # A full batch can hold 100 updates; orjson (when installed) parses it several times faster.
+        return _json.loads(response.content)
 
     def send_message(
         self,
@@ -64,46 +73,128 @@ class TelegramClient:
         reply_to: Optional[int] = None,
         keyboard: Optional[list[list[str]]] = None,
     ) -> Dict[str, Any]:
+        payload = self._message_fields(text, parse_mode, keyboard)
+        payload["chat_id"] = chat_id
+        if reply_to is not None:
+            payload["reply_to_message_id"] = reply_to
+
+        response = self._post_with_flood_wait(
+            self._urls["sendMessage"], data=_json.dumps(payload), headers=JSON_HEADERS
+        )
+        response.raise_for_status()
+        return _json.loads(response.content)
+
+    def prepare_message(
+        self,
+        text: str,
+        *,
+        parse_mode: Optional[str] = "HTML",
+        keyboard: Optional[list[list[str]]] = None,
+    ) -> bytes:
+        """Encode the chat-independent fields of a sendMessage body once, for `send_prepared`."""
+        body = _json.dumps(self._message_fields(text, parse_mode, keyboard))
+        # Drop the closing brace so send_prepared can append the per-chat fields.
+        return body[:-1]
+
+    def send_prepared(self, chat_id: int, prepared: bytes, *, reply_to: Optional[int] = None) -> Dict[str, Any]:
+        """Send a body built by `prepare_message`, only formatting the chat and reply ids."""
+        tail = f',"chat_id":{int(chat_id)}'
+        if reply_to is not None:
+            tail += f',"reply_to_message_id":{int(reply_to)}'
+        response = self._post_with_flood_wait(
+            self._urls["sendMessage"],
+            data=prepared + tail.encode("ascii") + b"}",
+            headers=JSON_HEADERS,
+        )
+        response.raise_for_status()
+        return _json.loads(response.content)
+
+    @staticmethod
+    def _message_fields(text: str, parse_mode: Optional[str], keyboard: Optional[list[list[str]]]) -> Dict[str, Any]:
         payload: Dict[str, Any] = {
-            "chat_id": chat_id,
             "text": text,
             "disable_web_page_preview": True,
         }
         if parse_mode:
             payload["parse_mode"] = parse_mode
-        if reply_to is not None:
-            payload["reply_to_message_id"] = reply_to
         if keyboard:
-            payload["reply_markup"] = json.dumps(
-                {
-                    "keyboard": keyboard,
-                    "resize_keyboard": True,
-                    "one_time_keyboard": False,
-                }
-            )
-
-        response = self.session.post(self._url("sendMessage"), json=payload, timeout=self.request_timeout)
-        response.raise_for_status()
-        return response.json()
+            payload["reply_markup"] = _reply_markup(tuple(tuple(row) for row in keyboard))
+        return payload
 
     def send_chat_action(self, chat_id: int, action: str = "typing") -> None:
         payload = {"chat_id": chat_id, "action": action}
-        response = self.session.post(self._url("sendChatAction"), data=payload, timeout=self.request_timeout)
+        response = self._post_with_flood_wait(self._urls["sendChatAction"], data=payload)
         response.raise_for_status()
 
+    def _post_with_flood_wait(self, url: str, **kwargs: Any) -> requests.Response:
+        """POST honoring Telegram's 429 `retry_after` instead of a blind backoff."""
+        for attempt in range(FLOOD_WAIT_ATTEMPTS):
+            response = self.session.post(url, timeout=self.request_timeout, **kwargs)
+            if response.status_code != 429 or attempt == FLOOD_WAIT_ATTEMPTS - 1:
+                return response
+            retry_after = self._retry_after(response)
+            logger.warning("Limite do Telegram atingido; aguardando %ss antes de reenviar.", retry_after)
+            time.sleep(retry_after)
+        return response
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> float:
+        try:
+            parameters = _json.loads(response.content).get("parameters") or {}
+            return float(parameters.get("retry_after", 1))
+        except (ValueError, AttributeError, TypeError):
+            return float(response.headers.get("Retry-After", 1) or 1)
+
     def delete_webhook(self, drop_pending_updates: bool = False) -> Dict[str, Any]:
         payload = {"drop_pending_updates": str(drop_pending_updates).lower()}
-        response = self.session.post(self._url("deleteWebhook"), data=payload, timeout=self.request_timeout)
+        response = self.session.post(self._urls["deleteWebhook"], data=payload, timeout=self.request_timeout)
         response.raise_for_status()
-        return response.json()
+        return _json.loads(response.content)
 
-    def get_file(self, file_id: str) -> Dict[str, Any]:
-        response = self.session.get(self._url("getFile"), params={"file_id": file_id}, timeout=self.request_timeout)
+    def set_webhook(self, url: str, secret_token: Optional[str] = None) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "url": url,
+            "allowed_updates": ALLOWED_UPDATES_JSON,
+        }
+        if secret_token:
+            payload["secret_token"] = secret_token
+        response = self.session.post(self._urls["setWebhook"], data=payload, timeout=self.request_timeout)
         response.raise_for_status()
-        return response.json()
+        return _json.loads(response.content)
 
-    def download_file(self, file_path: str) -> bytes:
-        file_url = f"https://api.telegram.org/file/bot{self.token}/{file_path}"
-        response = self.session.get(file_url, timeout=self.request_timeout)
+    def get_file(self, file_id: str) -> Dict[str, Any]:
+        response = self.session.get(self._urls["getFile"], params={"file_id": file_id}, timeout=self.request_timeout)
         response.raise_for_status()
-        return response.content
+        return _json.loads(response.content)
+
+    def _file_url(self, file_path: str) -> str:
+        return f"https://api.telegram.org/file/bot{self.token}/{file_path}"
+
+    def iter_file(self, file_path: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+        with self.session.get(self._file_url(file_path), timeout=self.request_timeout, stream=True) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    def download_file_to(self, file_path: str, dest: BinaryIO, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> int:
+        """Stream a file into ``dest`` chunk by chunk and return the number of bytes written."""
+        written = 0
+        for chunk in self.iter_file(file_path, chunk_size):
+            dest.write(chunk)
+            written += len(chunk)
+        return written
+
+    def download_file_b64(self, file_path: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+        """Download a file encoding it to base64 on the fly, without holding the raw bytes."""
+        encoded: list[bytes] = []
+        carry = b""
+        for chunk in self.iter_file(file_path, chunk_size):
+            if carry:
+                chunk = carry + chunk
+            # iter_content may yield short chunks; only encode 3-byte aligned blocks so the
+            # concatenated output stays valid base64.
+            aligned = len(chunk) - len(chunk) % 3
+            encoded.append(base64.b64encode(memoryview(chunk)[:aligned]))
+            carry = chunk[aligned:]
+        if carry:
+            encoded.append(base64.b64encode(carry))
+        return b"".join(encoded).decode("ascii")
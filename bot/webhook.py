@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import hmac
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict
+from urllib.parse import urlsplit
+
+from . import _json
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Telegram updates are small JSON documents; anything larger is not a legitimate update.
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class WebhookServer:
+    """Minimal HTTP endpoint that receives Telegram updates pushed via setWebhook.
+
+    Requests must carry ``secret`` (the value given to setWebhook) in the
+    ``X-Telegram-Bot-Api-Secret-Token`` header; anything else is rejected. Each accepted update is
+    handed to ``on_update`` and answered right away; the handler is expected to enqueue the work
+    (see ``ChatDispatcher``) rather than process it inline, so Telegram never waits on OpenAI.
+    """
+
+    def __init__(
+        self,
+        on_update: Callable[[Dict[str, Any]], None],
+        *,
+        secret: str,
+        path: str = "/",
+        host: str = "0.0.0.0",
+        port: int = 8080,
+    ) -> None:
+        self.on_update = on_update
+        if not secret:
+            raise ValueError("secret is required: the webhook endpoint is publicly reachable")
+        self.path = path or "/"
+        self.secret = secret
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @staticmethod
+    def path_from_url(url: str) -> str:
+        return urlsplit(url).path or "/"
+
+    def serve_forever(self) -> None:
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:  # noqa: N802 - name required by BaseHTTPRequestHandler
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+                received = self.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+                if not hmac.compare_digest(received, server.secret.encode("utf-8")):
+                    self._reply(403)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY_BYTES:
+                    self._reply(413)
+                    return
+                try:
+                    update = _json.loads(self.rfile.read(length))
+                except ValueError:
+                    self._reply(400)
+                    return
+                # Answer 200 whatever happens next, or Telegram would redeliver the update.
+                self._reply(200)
+                if isinstance(update, dict):
+                    server.on_update(update)
+
+            def _reply(self, status: int) -> None:
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format: str, *args: Any) -> None:
+                logger.debug("webhook: " + format, *args)
+
+        return _Handler
@@ -5,7 +5,7 @@ from __future__ import annotations
 import argparse
 import json
 import sys
-from typing import Any, Dict, Iterable
+from typing import Any, Iterable, Mapping
 
 from bot import BotApp, get_settings
 from bot.observability import MetricsRecorder
@@ -17,11 +17,12 @@ def _run_bot() -> None:
     app.run()
 
 
-def _load_metrics(path: str | None) -> Dict[str, Any]:
+def _load_metrics(path: str | None) -> Mapping[str, Any]:
     if not path:
         return {}
     recorder = MetricsRecorder.from_file(path)
-    return recorder.snapshot()
+    # The CLI only reads the metrics once, so a view of the loaded data is enough.
+    return recorder.snapshot_readonly()
 
 
 def _list_chats(path: str | None) -> Iterable[int]:
@@ -60,7 +61,7 @@ def main(argv: Iterable[str] | None = None) -> None:
     if args.command == "stats":
         metrics = _load_metrics(settings.metrics_file_path)
         if args.json:
-            print(json.dumps(metrics, ensure_ascii=False, indent=2))
+            print(json.dumps(dict(metrics), ensure_ascii=False, indent=2))
         else:
             if not metrics:
                 print("Nenhum dado de metricas disponivel. Configure METRICS_FILE ou CHAT_STATE_DIR.", file=sys.stderr)